@@ -1,27 +1,65 @@
 import os
 import json
+import fnmatch
+import hashlib
+import importlib
 import subprocess
-import sys
-import cv2
-import numpy as np
+import time
 import warnings
 from datetime import datetime, timedelta
-from typing import Iterable, List, Tuple
+from itertools import islice
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 try:  # support running as a script or a package module
-    from .hdr_utils import (
-        get_medium_exposure_image,
-        enhance_image,
-        align_images,
-        remove_ghosts,
+    from .planner import (
+        ExecutionPlan,
+        WorkerSlots,
+        available_cpus,
+        parse_size,
+        plan_job,
+        read_frame_size,
     )
+    from .work_queue import WorkQueue
 except ImportError:  # pragma: no cover - fallback for direct execution
-    from hdr_utils import (
-        get_medium_exposure_image,
-        enhance_image,
-        align_images,
-        remove_ghosts,
+    from planner import (
+        ExecutionPlan,
+        WorkerSlots,
+        available_cpus,
+        parse_size,
+        plan_job,
+        read_frame_size,
     )
+    from work_queue import WorkQueue
+
+if TYPE_CHECKING:  # pragma: no cover - imported lazily at runtime
+    from .output_writer import OutputWriter
+    from .shared_buffers import SharedArray
+
+# cv2/numpy and the modules that depend on them are only imported on first
+# pixel work so that scanning and dry runs start instantly.
+_LAZY_ATTRS = {
+    "get_medium_exposure_image": "hdr_utils",
+    "enhance_image": "hdr_utils",
+    "align_images": "hdr_utils",
+    "remove_ghosts": "hdr_utils",
+    "OutputWriter": "output_writer",
+    "write_outputs": "output_writer",
+    "SharedArray": "shared_buffers",
+}
+
+
+def _sibling(name: str):
+    """Import sibling module *name*, supporting package and script use."""
+    if __package__:
+        return importlib.import_module(f".{name}", __package__)
+    return importlib.import_module(name)
+
+
+def __getattr__(name: str):
+    module = _LAZY_ATTRS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(_sibling(module), name)
 
 
 def _run_exiftool_json(paths: Iterable[str], tags: Iterable[str]) -> list:
@@ -41,13 +79,133 @@ def _run_exiftool_json(paths: Iterable[str], tags: Iterable[str]) -> list:
         return []
 
 
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff")
+
+
+def _matches(name: str, patterns: Optional[Sequence[str]]) -> bool:
+    """Return True if *name* matches any of the glob *patterns*."""
+    return any(fnmatch.fnmatch(name.lower(), pat.lower()) for pat in patterns or ())
+
+
+def iter_image_files(
+    directory: str,
+    include: Optional[Sequence[str]] = None,
+    exclude: Optional[Sequence[str]] = None,
+    recursive: bool = True,
+) -> Iterator[str]:
+    """Yield image paths below *directory* using ``os.scandir``.
+
+    Entries are visited in name order so frames from the same bracket stay
+    adjacent. *include* and *exclude* are glob patterns matched against the
+    file name; *exclude* is also applied to directory names so whole
+    subtrees can be skipped."""
+    try:
+        with os.scandir(directory) as it:
+            entries = sorted(it, key=lambda e: e.name)
+    except OSError as exc:
+        print(f"Warning: Could not read directory {directory}: {exc}")
+        return
+    for entry in entries:
+        if _matches(entry.name, exclude):
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            if recursive:
+                yield from iter_image_files(entry.path, include, exclude, recursive)
+            continue
+        if not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        if include and not _matches(entry.name, include):
+            continue
+        yield entry.path
+
+
+def _chunked(items: Iterable, size: int) -> Iterator[list]:
+    """Yield lists of at most *size* items from *items*."""
+    it = iter(items)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_aeb_metadata(
+    image_paths: Iterable[str], batch_size: int = 200
+) -> Iterator[Tuple[str, datetime, float]]:
+    """Yield ``(path, capture_time, exposure_time)`` for AEB-tagged images.
+
+    Paths are sent to exiftool in batches of *batch_size* so metadata is
+    read while the directory walk is still in progress. Images without a
+    capture time or a parsable exposure time are skipped."""
+    tags = ["XPKeywords", "ExposureTime", "DateTimeOriginal"]
+    for chunk in _chunked(image_paths, batch_size):
+        meta = {d.get("SourceFile"): d for d in _run_exiftool_json(chunk, tags)}
+        for path in chunk:
+            entry = meta.get(path)
+            if entry is None:
+                continue
+            if "aeb" not in str(entry.get("XPKeywords", "")).lower():
+                continue
+            try:
+                dt = datetime.strptime(
+                    str(entry.get("DateTimeOriginal", "")).strip()[:19],
+                    "%Y:%m:%d %H:%M:%S",
+                )
+            except ValueError:
+                continue
+            ok, value = _parse_exposure(str(entry.get("ExposureTime", "")))
+            if not ok:
+                print(
+                    f"Warning: Could not parse exposure time for image {os.path.basename(path)} with value '{entry.get('ExposureTime', '')}'. Skipping this image."
+                )
+                continue
+            yield path, dt, value
+
+
+def iter_bracket_groups(
+    metadata: Iterable[Tuple[str, datetime, float]],
+    threshold: timedelta = timedelta(seconds=2),
+) -> Iterator[Tuple[List[str], List[float]]]:
+    """Yield ``(paths, exposure_times)`` for each bracket in *metadata*.
+
+    As in :func:`group_images_by_datetime`, a group spans at most
+    *threshold* from its first frame, so back-to-back brackets, bursts and
+    time-lapses are not chained together. A group is emitted as soon as a
+    frame falls outside that window (or goes back in time), so merging can
+    start before the scan ends."""
+    paths: List[str] = []
+    times: List[float] = []
+    start: Optional[datetime] = None
+    last: Optional[datetime] = None
+    for path, dt, exposure in metadata:
+        if paths and (dt - start > threshold or dt < last):
+            yield paths, times
+            paths, times = [], []
+        if not paths:
+            start = dt
+        paths.append(path)
+        times.append(exposure)
+        last = dt
+    if paths:
+        yield paths, times
+
+
+def discover_aeb_groups(
+    directory: str,
+    include: Optional[Sequence[str]] = None,
+    exclude: Optional[Sequence[str]] = None,
+    recursive: bool = True,
+    batch_size: int = 200,
+    threshold: timedelta = timedelta(seconds=2),
+) -> Iterator[Tuple[List[str], List[float]]]:
+    """Stream AEB bracket groups found below *directory*."""
+    paths = iter_image_files(directory, include, exclude, recursive)
+    return iter_bracket_groups(iter_aeb_metadata(paths, batch_size), threshold)
+
+
 def find_aeb_images(directory: str) -> List[str]:
     """Return all image files in *directory* tagged with 'AEB'."""
-    image_files = [
-        os.path.join(directory, f)
-        for f in os.listdir(directory)
-        if f.lower().endswith((".png", ".jpg", ".jpeg", ".tif", ".tiff"))
-    ]
+    image_files = list(iter_image_files(directory, recursive=False))
     data = _run_exiftool_json(image_files, ["XPKeywords"])
     keywords = {d.get("SourceFile"): str(d.get("XPKeywords", "")) for d in data}
     return [p for p in image_files if "aeb" in keywords.get(p, "").lower()]
@@ -119,7 +277,120 @@ def find_aeb_images_and_exposure_times_from_list(image_paths: Iterable[str]) ->
     return aeb_images, exposure_times
 
 
+def read_image_sizes(image_paths: Iterable[str]) -> Dict[str, Tuple[int, int]]:
+    """Return ``{path: (width, height)}`` read from the file headers."""
+    sizes = {}
+    for entry in _run_exiftool_json(list(image_paths), ["ImageWidth", "ImageHeight"]):
+        try:
+            sizes[entry["SourceFile"]] = (int(entry["ImageWidth"]), int(entry["ImageHeight"]))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return sizes
+
+
+def _format_exposure(value: float) -> str:
+    """Return *value* seconds formatted like a camera shutter speed."""
+    if 0 < value < 1:
+        return f"1/{round(1 / value)}"
+    return f"{value:g}"
+
+
+def _format_bytes(value: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1024 or unit == "GB":
+            return f"{value:.1f} {unit}"
+        value /= 1024
+
+
+def frame_size(paths: Sequence[str]) -> Optional[Tuple[int, int]]:
+    """Return the largest ``(width, height)`` of *paths* without decoding.
+
+    File headers are parsed directly; exiftool is only used as a fallback
+    for formats the header reader does not understand."""
+    size = read_frame_size(paths)
+    if size is None:
+        sizes = read_image_sizes(paths)
+        if sizes:
+            size = max(sizes.values(), key=lambda s: s[0] * s[1])
+    return size
+
+
+def plan_group(
+    paths: Sequence[str],
+    align: bool = False,
+    deghost: bool = False,
+    memory_budget: Optional[int] = None,
+    latency_budget: Optional[float] = None,
+    out_of_core: bool = False,
+    max_workers: int = 1,
+) -> Optional[ExecutionPlan]:
+    """Return the :func:`planner.plan_job` plan for a bracket, if its size is known."""
+    size = frame_size(paths)
+    if size is None:
+        return None
+    return plan_job(
+        size[0],
+        size[1],
+        len(paths),
+        align,
+        deghost,
+        memory_budget=memory_budget,
+        latency_budget=latency_budget,
+        out_of_core=out_of_core,
+        max_workers=max_workers,
+    )
+
+
+def scan_groups(
+    groups: Iterable[Tuple[List[str], List[float]]],
+    align: bool = False,
+    deghost: bool = False,
+    memory_budget: Optional[int] = None,
+    latency_budget: Optional[float] = None,
+    out_of_core: bool = False,
+) -> Tuple[int, float, int]:
+    """Print detected groups and the estimated work without merging.
+
+    OpenCV is never imported. Each group is shown with the plan that batch
+    mode would use, including how many such groups it would merge at once.
+    Returns the number of groups, the total megapixels and the largest
+    per-group memory estimate."""
+    count, total_mp, peak = 0, 0.0, 0
+    for count, (paths, times) in enumerate(groups, start=1):
+        size = frame_size(paths)
+        if size:
+            width, height = size
+            mp = width * height * len(paths) / 1e6
+            plan = plan_group(
+                paths,
+                align,
+                deghost,
+                memory_budget,
+                latency_budget,
+                out_of_core,
+                max_workers=available_cpus(),
+            )
+            memory = plan.peak_memory
+            work = (
+                f"{width}x{height}, {mp:.1f} MP, est. peak memory {_format_bytes(memory)}"
+                f"\n  plan: {plan.describe()}"
+            )
+        else:
+            mp, memory = 0.0, 0
+            work = "size unknown"
+        total_mp += mp
+        peak = max(peak, memory)
+        exposures = ", ".join(_format_exposure(t) for t in times)
+        print(f"Group {count}: {len(paths)} frames ({exposures} s), {work}")
+        for path in paths:
+            print(f"  {path}")
+    print(f"Total: {count} groups, {total_mp:.1f} MP, est. peak memory {_format_bytes(peak)}")
+    return count, total_mp, peak
+
+
 def load_images(image_paths):
+    import cv2
+
     images = []
     for path in image_paths:
         img = cv2.imread(path)
@@ -127,20 +398,57 @@ def load_images(image_paths):
     return images
 
 
+def load_image_stack(image_paths, scratch_dir: Optional[str] = None) -> "SharedArray":
+    """Decode *image_paths* into one shared ``(N, H, W, 3)`` uint8 stack.
+
+    The returned :class:`shared_buffers.SharedArray` handle can be sent to
+    other processes instead of the pixel data. With *scratch_dir* the stack
+    is backed by an mmap scratch file rather than shared memory."""
+    import cv2
+
+    stack = None
+    for i, path in enumerate(image_paths):
+        img = cv2.imread(path)
+        if img is None:
+            if stack is not None:
+                stack.unlink()
+            raise ValueError(f"Failed to load image {path}")
+        if stack is None:
+            stack = _sibling("shared_buffers").SharedArray.create(
+                (len(image_paths), *img.shape), img.dtype, scratch_dir
+            )
+        elif img.shape != stack.shape[1:]:
+            stack.unlink()
+            raise ValueError("All images in a group must have the same size")
+        stack.array()[i] = img
+    if stack is None:
+        raise ValueError("No images provided for HDR merge")
+    return stack
+
+
 def create_hdr(
     images,
     exposure_times,
     align: bool = False,
     deghost: bool = False,
+    out=None,
+    scratch=None,
+    max_pixels: Optional[int] = None,
 ):
     """Create an HDR image with optional alignment and deghosting.
 
     The function validates the inputs and raises ``ValueError`` when the
     provided lists do not match the expected lengths or contain invalid
     values. ``warnings.warn`` is used when alignment or deghosting is
-    requested for a single image."""
+    requested for a single image.
+
+    *out* is an optional preallocated float32 ``(H, W, 3)`` buffer for the
+    radiance map and *scratch* an optional uint8 ``(N, H, W, 3)`` stack,
+    which may be *images* itself, for the aligned and deghosted frames.
+    *max_pixels* runs alignment and the ghost mask at reduced resolution
+    (see :func:`planner.plan_job`)."""
 
-    if not images:
+    if len(images) == 0:
         raise ValueError("No images provided for HDR merge")
 
     if len(images) != len(exposure_times):
@@ -152,61 +460,321 @@ def create_hdr(
     if (align or deghost) and len(images) < 2:
         warnings.warn("Alignment or deghosting requested with a single image; ignoring")
 
+    import cv2
+    import numpy as np
+
+    hdr_utils = _sibling("hdr_utils")
     proc_images = images
     if align and len(images) > 1:
-        proc_images = align_images(proc_images)
+        proc_images = hdr_utils.align_images(proc_images, out=scratch, max_pixels=max_pixels)
     if deghost and len(images) > 1:
-        proc_images = remove_ghosts(proc_images)
+        proc_images = hdr_utils.remove_ghosts(proc_images, out=scratch, max_pixels=max_pixels)
 
     times = np.asarray(exposure_times, dtype=np.float32)
     merge_debevec = cv2.createMergeDebevec()
-    hdr = merge_debevec.process(proc_images, times=times)
+    hdr = merge_debevec.process(list(proc_images), times=times, dst=out)
     return hdr
 
 
-def save_hdr_image(hdr_image, save_path, group_index, images=None, exposure_times=None):
+def merge_shared(
+    frames: "SharedArray",
+    exposure_times: List[float],
+    hdr: "SharedArray",
+    ldr: Optional["SharedArray"] = None,
+    align: bool = False,
+    deghost: bool = False,
+    **tonemap_options,
+) -> None:
+    """Merge a shared frame stack in place; safe to run in any process.
+
+    Alignment and deghosting overwrite *frames*, the radiance map is written
+    into *hdr* and, if given, the tonemapped result into *ldr*. Like the
+    other pipelines, tone mapping uses the original median-exposure frame
+    as its reference. Only the handles are pickled when this is submitted
+    to a process pool."""
+    stack = frames.array()
+    try:
+        ref = None
+        if ldr is not None:  # copied before alignment overwrites the stack
+            hdr_utils = _sibling("hdr_utils")
+            ref = hdr_utils.get_medium_exposure_image(list(stack), exposure_times).copy()
+        hdr_image = create_hdr(
+            stack, exposure_times, align, deghost, out=hdr.array(), scratch=stack
+        )
+        if ldr is not None:
+            ldr.array()[...] = hdr_utils.tonemap(hdr_image, ref, **tonemap_options)
+    finally:
+        for handle in (frames, hdr, ldr):
+            if handle is not None:
+                handle.release()
+
+
+def tonemap_enhanced(hdr_image, reference=None):
+    """Return the 8-bit Mantiuk tonemap of *hdr_image*, enhanced against *reference*.
+
+    This is the look of the batch outputs; both merge strategies use it."""
+    import cv2
+    import numpy as np
+
     tonemapMantiuk = cv2.createTonemapMantiuk()
     tonemapMantiuk.setSaturation(1.0)
     tonemapMantiuk.setScale(1.0)
     ldr = tonemapMantiuk.process(hdr_image.copy())
     ldr_8bit = np.clip(ldr * 255, 0, 255).astype("uint8")
+    return _sibling("hdr_utils").enhance_image(ldr_8bit, reference)
+
 
+def save_hdr_image(
+    hdr_image,
+    save_path,
+    group_index,
+    images=None,
+    exposure_times=None,
+    writer: Optional["OutputWriter"] = None,
+    **output_options,
+):
+    """Tonemap *hdr_image* and write it to *save_path*.
+
+    When *writer* is given the encoding is queued on its background pool
+    and a future is returned; otherwise the written paths are returned.
+    *output_options* are passed to :func:`output_writer.write_outputs`."""
     ref = (
-        get_medium_exposure_image(images, exposure_times)
+        _sibling("hdr_utils").get_medium_exposure_image(images, exposure_times)
         if images and exposure_times
         else None
     )
-    enhanced = enhance_image(ldr_8bit, ref)
+    enhanced = tonemap_enhanced(hdr_image, ref)
 
     output_path = os.path.join(save_path, f"hdr_image_{group_index}_mantiuk.jpg")
-    cv2.imwrite(output_path, enhanced)
+    if writer is not None:
+        return writer.submit(enhanced, output_path, **output_options)
+    return _sibling("output_writer").write_outputs(enhanced, output_path, **output_options)
 
 
-if __name__ == "__main__":
-    input_dir = sys.argv[1] if len(sys.argv) > 1 else os.environ.get("INPUT_DIR")
-    output_dir = sys.argv[2] if len(sys.argv) > 2 else os.environ.get("OUTPUT_DIR")
+MANIFEST_TASK = "manifest"
 
-    all_image_paths = find_aeb_images(
-        input_dir
-    )  # Assume this returns all AEB image paths
-    grouped_image_paths = group_images_by_datetime(all_image_paths)
 
-    for group_index, image_group in enumerate(grouped_image_paths, start=1):
-        aeb_images, exposure_times = find_aeb_images_and_exposure_times_from_list(
-            image_group
-        )
-        if not aeb_images:
-            print(f"No AEB-tagged images found in group {group_index}.")
+def group_id(paths: Sequence[str]) -> str:
+    """Return a stable identifier for the bracket made of *paths*."""
+    joined = "\n".join(os.path.abspath(p) for p in paths)
+    return hashlib.sha1(joined.encode("utf-8")).hexdigest()[:16]
+
+
+def merge_group(
+    output_dir: str,
+    name: str,
+    paths: List[str],
+    exposure_times: List[float],
+    writer: Optional["OutputWriter"] = None,
+    memory_budget: Optional[int] = None,
+    latency_budget: Optional[float] = None,
+    scratch_dir: Optional[str] = None,
+    plan: Optional[ExecutionPlan] = None,
+    **output_options,
+):
+    """Merge one bracket and write it as ``hdr_image_<name>_mantiuk.jpg``.
+
+    The execution strategy is chosen by :func:`plan_group` unless *plan*
+    is given, and logged before any pixel work. Returns the written paths,
+    or a future when *writer* is given and the whole-frame strategy is
+    used."""
+    if plan is None:
+        plan = plan_group(paths, memory_budget=memory_budget, latency_budget=latency_budget)
+    if plan is not None:
+        print(f"Group {name}: plan {plan.describe()}", flush=True)
+        _sibling("planner").apply_threads(plan)
+        if plan.strategy == "out-of-core":
+            out_of_core = _sibling("out_of_core")
+            output_path = os.path.join(output_dir, f"hdr_image_{name}_mantiuk.jpg")
+            if writer is not None:  # encode synchronously, before scratch is freed
+                output_options = {**writer.options, **output_options}
+            with out_of_core.create_hdr_out_of_core(
+                paths,
+                exposure_times,
+                out_of_core.scratch_directory(scratch_dir, output_dir),
+                tonemap_func=tonemap_enhanced,
+            ) as ldr:
+                return _sibling("output_writer").write_outputs(
+                    ldr.array(), output_path, **output_options
+                )
+    images = load_images(paths)
+    if not images or any(img is None for img in images):
+        raise ValueError(f"Failed to load images for group {name}")
+    hdr_image = create_hdr(
+        images, exposure_times, max_pixels=plan.proxy_pixels if plan else None
+    )
+    return save_hdr_image(
+        hdr_image, output_dir, name, images, exposure_times, writer=writer, **output_options
+    )
+
+
+def run_worker(
+    state_dir: str,
+    discover: Callable[[], Iterable[Tuple[List[str], List[float]]]],
+    process: Callable[[str, List[str], List[float]], List[str]],
+    lease_seconds: float = 300.0,
+    poll_interval: float = 5.0,
+    worker_id: Optional[str] = None,
+) -> List[str]:
+    """Process bracket groups from a shared :class:`WorkQueue` in *state_dir*.
+
+    Start any number of workers against the same *state_dir*. The first to
+    lease the manifest task streams *discover* into the queue while the
+    others start merging; if it dies, another worker rescans. Each group is
+    leased, passed to *process* and marked done, and groups of crashed
+    workers are picked up again once their lease expires. Outputs are named
+    after :func:`group_id`, so re-running a group overwrites the same file.
+    Returns the ids of the groups processed by this worker."""
+    queue = WorkQueue(state_dir, lease_seconds, worker_id)
+    processed: List[str] = []
+    failed = set()
+    while True:
+        if not queue.is_done(MANIFEST_TASK) and queue.try_lease(MANIFEST_TASK):
+            with queue.heartbeat(MANIFEST_TASK):
+                for paths, times in discover():
+                    queue.add(group_id(paths), {"paths": paths, "exposure_times": times})
+            queue.complete(MANIFEST_TASK, {})
+            continue
+        task = queue.claim(skip=failed)
+        if task is None:
+            remaining = [t for t in queue.pending() if t not in failed]
+            if queue.is_done(MANIFEST_TASK) and not remaining:
+                break
+            time.sleep(poll_interval)
+            continue
+        payload = queue.load(task)
+        try:
+            with queue.heartbeat(task):
+                outputs = process(task, payload["paths"], payload["exposure_times"])
+        except Exception as exc:
+            print(f"Warning: Group {task} failed on {queue.worker_id}: {exc}")
+            queue.release(task)
+            failed.add(task)
             continue
+        queue.complete(task, {"outputs": outputs})
+        processed.append(task)
+        print(f"Group {task}: HDR image saved to {', '.join(outputs)}")
+    return processed
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    import argparse
+    from concurrent.futures import ThreadPoolExecutor
+    from functools import partial
+
+    parser = argparse.ArgumentParser(description="Find AEB brackets and merge them to HDR")
+    parser.add_argument("input_dir", nargs="?", default=os.environ.get("INPUT_DIR"))
+    parser.add_argument("output_dir", nargs="?", default=os.environ.get("OUTPUT_DIR"))
+    parser.add_argument("--include", action="append", help="glob of file names to include")
+    parser.add_argument("--exclude", action="append", help="glob of file or directory names to skip")
+    parser.add_argument("--no-recursive", action="store_true", help="only scan the top-level directory")
+    parser.add_argument("--batch-size", type=int, default=200, help="files per exiftool call")
+    parser.add_argument("--quality", type=int, default=95, help="JPEG/WebP quality")
+    parser.add_argument("--progressive", action="store_true", help="write progressive JPEGs")
+    parser.add_argument("--subsampling", choices=["444", "422", "420"], help="JPEG chroma subsampling")
+    parser.add_argument("--web-format", choices=["webp", "png"], help="also write a web copy")
+    parser.add_argument("--thumbnail", type=int, default=0, help="also write a thumbnail of this size")
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="only list detected groups and estimated work, without loading OpenCV",
+    )
+    parser.add_argument(
+        "--state-dir",
+        help="shared directory for distributed mode; start one worker per process/host",
+    )
+    parser.add_argument("--lease-seconds", type=float, default=300.0, help="lease expiry in distributed mode")
+    parser.add_argument("--worker-id", help="worker name in distributed mode (default host-pid)")
+    parser.add_argument("--memory-budget", type=parse_size, help="memory budget per group, e.g. 8G")
+    parser.add_argument("--latency-budget", type=float, help="target seconds per group")
+    parser.add_argument(
+        "--scratch-dir", help="directory for out-of-core scratch files (default: output_dir)"
+    )
+    args = parser.parse_args(argv)
+    input_dir, output_dir = args.input_dir, args.output_dir
+    if not input_dir or (not output_dir and not args.dry_run):
+        parser.error("input_dir and output_dir are required")
+
+    groups = discover_aeb_groups(
+        input_dir,
+        include=args.include,
+        exclude=args.exclude,
+        recursive=not args.no_recursive,
+        batch_size=args.batch_size,
+    )
+    if args.dry_run:
+        scan_groups(groups, memory_budget=args.memory_budget, latency_budget=args.latency_budget)
+        return
+    plan_options = dict(
+        memory_budget=args.memory_budget,
+        latency_budget=args.latency_budget,
+        scratch_dir=args.scratch_dir,
+    )
 
-        images = load_images(aeb_images)
-        if images:
-            hdr_image = create_hdr(images, exposure_times)
-            save_hdr_image(hdr_image, output_dir, group_index, images, exposure_times)
-            print(
-                f"Group {group_index}: HDR image saved to {output_dir}/hdr_image_{group_index}.jpg"
+    output_options = dict(
+        quality=args.quality,
+        progressive=args.progressive,
+        subsampling=args.subsampling,
+        web_format=args.web_format,
+        thumbnail_size=args.thumbnail,
+    )
+    if args.state_dir:
+        run_worker(
+            args.state_dir,
+            discover=lambda: groups,
+            process=partial(merge_group, output_dir, **plan_options, **output_options),
+            lease_seconds=args.lease_seconds,
+            worker_id=args.worker_id,
+        )
+        return
+
+    def _report_saved(index, future):
+        error = future.exception()
+        if error is None:
+            print(f"Group {index}: HDR image saved to {future.result()[0]}")
+        else:
+            print(f"Group {index}: Failed to write HDR image: {error}")
+
+    def _merge(group_index, aeb_images, exposure_times, plan):
+        try:
+            result = merge_group(
+                output_dir,
+                group_index,
+                aeb_images,
+                exposure_times,
+                writer=writer,
+                plan=plan,
+                **plan_options,
             )
+        except ValueError:
+            print(f"Group {group_index}: Failed to load images or exposure times are missing.")
+            return
+        if isinstance(result, list):
+            print(f"Group {group_index}: HDR image saved to {result[0]}")
         else:
-            print(
-                f"Group {group_index}: Failed to load images or exposure times are missing."
+            result.add_done_callback(partial(_report_saved, group_index))
+
+    # Groups run side by side as far as their plans allow; OpenCV releases
+    # the GIL, so threads are enough.
+    cpus = available_cpus()
+    slots = WorkerSlots()
+    writer = _sibling("output_writer").OutputWriter(**output_options)
+    with writer, ThreadPoolExecutor(max_workers=cpus) as pool:
+        jobs = []
+        for group_index, (aeb_images, exposure_times) in enumerate(groups, start=1):
+            plan = plan_group(
+                aeb_images,
+                memory_budget=args.memory_budget,
+                latency_budget=args.latency_budget,
+                max_workers=cpus,
             )
+            share = slots.acquire(plan)
+            job = pool.submit(_merge, group_index, aeb_images, exposure_times, plan)
+            job.add_done_callback(lambda _, share=share: slots.release(share))
+            jobs.append(job)
+        for job in jobs:
+            job.result()
+
+
+if __name__ == "__main__":
+    main()
@@ -85,6 +85,8 @@ export async function POST(req: Request) {
         if (line.startsWith('PROGRESS')) {
           const pct = line.split(' ')[1];
           send('progress', pct);
+        } else if (line.startsWith('PLAN')) {
+          // execution plan chosen by the planner; informational only
         } else {
           finalPath = line.trim();
         }
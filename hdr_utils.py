@@ -2,6 +2,11 @@ import cv2
 import numpy as np
 from typing import List, Sequence, Optional
 
+try:  # support running as a script or a package module
+    from .planner import proxy_factor
+except ImportError:  # pragma: no cover - fallback for direct execution
+    from planner import proxy_factor
+
 
 def get_medium_exposure_image(
     images: Sequence[np.ndarray], exposure_times: Sequence[float]
@@ -109,35 +114,81 @@ def tonemap_mantiuk(
     )
 
 
-def align_images(images: List[np.ndarray]) -> List[np.ndarray]:
-    """Align images to the first image using phase correlation."""
-    if not images:
-        return images
-    aligned = [images[0]]
-    ref_gray = cv2.cvtColor(images[0], cv2.COLOR_BGR2GRAY)
-    for img in images[1:]:
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+def _shrink(img: np.ndarray, factor: int) -> np.ndarray:
+    """Block-average *img* by an integer *factor*."""
+    if factor == 1:
+        return img
+    size = (max(1, img.shape[1] // factor), max(1, img.shape[0] // factor))
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+
+
+def align_images(
+    images: Sequence[np.ndarray],
+    out: Optional[np.ndarray] = None,
+    max_pixels: Optional[int] = None,
+) -> List[np.ndarray]:
+    """Align images to the first image using phase correlation.
+
+    When *out* is a preallocated ``(N, H, W, 3)`` uint8 stack the aligned
+    frames are written into it (it may be the input stack itself) and a
+    list of views into *out* is returned. With *max_pixels* the shift is
+    estimated on frames downscaled to at most that many pixels."""
+    if len(images) == 0:
+        return images if out is None else []
+    factor = proxy_factor(images[0].shape, max_pixels) if max_pixels else 1
+    if out is not None and not np.shares_memory(out[0], images[0]):
+        np.copyto(out[0], images[0])
+    aligned = [images[0] if out is None else out[0]]
+    ref_gray = _shrink(cv2.cvtColor(images[0], cv2.COLOR_BGR2GRAY), factor)
+    for i, img in enumerate(images[1:], start=1):
+        gray = _shrink(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), factor)
         shift = cv2.phaseCorrelate(np.float32(ref_gray), np.float32(gray))[0]
+        shift = (shift[0] * factor, shift[1] * factor)
         matrix = np.float32([[1, 0, shift[0]], [0, 1, shift[1]]])
         aligned_img = cv2.warpAffine(
             img,
             matrix,
             (img.shape[1], img.shape[0]),
+            dst=None if out is None else out[i],
             flags=cv2.INTER_LINEAR + cv2.WARP_INVERSE_MAP,
         )
         aligned.append(aligned_img)
     return aligned
 
 
-def remove_ghosts(images: List[np.ndarray], threshold: int = 25) -> List[np.ndarray]:
+def remove_ghosts(
+    images: Sequence[np.ndarray],
+    threshold: int = 25,
+    out: Optional[np.ndarray] = None,
+    max_pixels: Optional[int] = None,
+) -> List[np.ndarray]:
     """Replace pixels that deviate from the median with the reference image.
 
     This version uses vectorised numpy operations for improved performance
-    when processing many images."""
-    if not images:
-        return images
-
-    stack = np.stack(images).astype(np.float32)
+    when processing many images. As with :func:`align_images`, *out* may
+    be a preallocated uint8 stack (including the input stack) to write the
+    result into, and *max_pixels* computes the ghost mask at reduced
+    resolution so no full-size float copy of the stack is made."""
+    if len(images) == 0:
+        return images if out is None else []
+
+    factor = proxy_factor(images[0].shape, max_pixels) if max_pixels else 1
+    if factor > 1:
+        h, w = images[0].shape[:2]
+        small = np.stack([_shrink(img, factor) for img in images]).astype(np.float32)
+        small_mask = np.abs(small - np.median(small, axis=0)).sum(axis=3) > threshold
+        reference = np.array(images[0])
+        result = []
+        for i, (img, m) in enumerate(zip(images, small_mask)):
+            mask = cv2.resize(m.astype(np.uint8), (w, h), interpolation=cv2.INTER_NEAREST) > 0
+            dst = np.array(img) if out is None else out[i]
+            if out is not None and not np.shares_memory(dst, img):
+                np.copyto(dst, img)
+            np.copyto(dst, reference, where=mask[..., None])
+            result.append(dst)
+        return result
+
+    stack = np.asarray(images).astype(np.float32)
     median = np.median(stack, axis=0)
     reference = stack[0]
 
@@ -145,6 +196,11 @@ def remove_ghosts(images: List[np.ndarray], threshold: int = 25) -> List[np.ndar
     diff = np.abs(stack - median).sum(axis=3)
     mask = diff > threshold
 
+    if out is not None:
+        np.copyto(out, stack, casting="unsafe")
+        np.copyto(out, reference, casting="unsafe", where=mask[..., None])
+        return list(out)
+
     # Replace deviating pixels with the reference image for all frames
     stack = np.where(mask[..., None], reference, stack)
 
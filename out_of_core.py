@@ -0,0 +1,260 @@
+import os
+import math
+import warnings
+import cv2
+import numpy as np
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+try:  # support running as a script or a package module
+    from .find_and_merge_aeb import create_hdr, load_image_stack
+    from .hdr_utils import remove_ghosts, tonemap
+    from .planner import OUT_OF_CORE_BAND_ROWS, PROXY_PIXELS, proxy_factor
+    from .shared_buffers import SharedArray
+except ImportError:  # pragma: no cover - fallback for direct execution
+    from find_and_merge_aeb import create_hdr, load_image_stack
+    from hdr_utils import remove_ghosts, tonemap
+    from planner import OUT_OF_CORE_BAND_ROWS, PROXY_PIXELS, proxy_factor
+    from shared_buffers import SharedArray
+
+DEFAULT_BAND_ROWS = OUT_OF_CORE_BAND_ROWS
+# Size of the reduced-resolution proxy used for alignment and tone mapping.
+DEFAULT_PROXY_PIXELS = PROXY_PIXELS
+
+
+def _filesystem_type(path: str) -> Optional[str]:
+    """Return the type of the filesystem holding *path*, if known."""
+    path = os.path.realpath(path)
+    best, fstype = "", None
+    try:
+        with open("/proc/mounts") as fh:
+            for line in fh:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount = fields[1].replace("\\040", " ")
+                inside = path == mount or path.startswith(mount.rstrip("/") + "/")
+                if inside and len(mount) >= len(best):
+                    best, fstype = mount, fields[2]
+    except OSError:
+        return None
+    return fstype
+
+
+def scratch_directory(scratch_dir: Optional[str], output_dir: str) -> str:
+    """Return the directory for scratch files of a job writing to *output_dir*.
+
+    Without an explicit *scratch_dir* the scratch files go next to the
+    output rather than into the temp directory, which is often a RAM-backed
+    tmpfs. A warning is issued if the chosen directory is held in RAM."""
+    directory = scratch_dir or output_dir or "."
+    if _filesystem_type(directory) in ("tmpfs", "ramfs"):
+        warnings.warn(
+            f"Scratch directory {directory} is on a RAM-backed filesystem; "
+            "pass --scratch-dir on a local disk to keep out-of-core data out of memory"
+        )
+    return directory
+
+
+def iter_bands(height: int, rows: int) -> Iterator[Tuple[int, int]]:
+    """Yield ``(start, stop)`` row ranges covering *height* rows."""
+    for start in range(0, height, rows):
+        yield start, min(start + rows, height)
+
+
+def _band_rows(rows: int, factor: int) -> int:
+    # Bands must start on multiples of the proxy factor so that band-wise
+    # downscaling and upscaling line up with the whole-image result.
+    return max(factor, rows // factor * factor)
+
+
+def downscale(image: np.ndarray, factor: int, rows: int = DEFAULT_BAND_ROWS) -> np.ndarray:
+    """Block-average *image* by *factor*, reading it band by band."""
+    if factor == 1:
+        return np.array(image)
+    h, w = image.shape[:2]
+    out_w = max(1, w // factor)
+    parts = []
+    for y0, y1 in iter_bands(h, _band_rows(rows, factor)):
+        band = np.ascontiguousarray(image[y0:y1])
+        out_h = -(-(y1 - y0) // factor)  # a short tail band still gets a row
+        parts.append(cv2.resize(band, (out_w, out_h), interpolation=cv2.INTER_AREA))
+    return np.concatenate(parts, axis=0)
+
+
+def _upscale_band(proxy: np.ndarray, y0: int, y1: int, width: int, factor: int) -> np.ndarray:
+    """Return rows ``y0:y1`` of *proxy* upscaled by *factor* to *width*.
+
+    *proxy* must have ``ceil(height / factor)`` rows, as :func:`downscale`
+    produces, so the upscaled slice always covers ``y1 - y0`` rows."""
+    p0 = max(0, y0 // factor - 1)
+    p1 = min(proxy.shape[0], -(-y1 // factor) + 1)
+    part = cv2.resize(
+        proxy[p0:p1], (width, (p1 - p0) * factor), interpolation=cv2.INTER_LINEAR
+    )
+    band = part[y0 - p0 * factor : y1 - p0 * factor]
+    if len(band) != y1 - y0:
+        raise ValueError(f"Proxy with {len(proxy)} rows does not cover rows {y0}:{y1}")
+    return band
+
+
+def estimate_shift(
+    reference: np.ndarray, image: np.ndarray, max_pixels: int = DEFAULT_PROXY_PIXELS
+) -> Tuple[float, float]:
+    """Return the ``(dx, dy)`` translation of *image* relative to *reference*."""
+    factor = proxy_factor(reference.shape, max_pixels)
+    ref = cv2.cvtColor(downscale(reference, factor), cv2.COLOR_BGR2GRAY)
+    img = cv2.cvtColor(downscale(image, factor), cv2.COLOR_BGR2GRAY)
+    (dx, dy), _ = cv2.phaseCorrelate(np.float32(ref), np.float32(img))
+    return dx * factor, dy * factor
+
+
+def align_chunked(
+    frames: np.ndarray,
+    out: np.ndarray,
+    rows: int = DEFAULT_BAND_ROWS,
+    max_pixels: int = DEFAULT_PROXY_PIXELS,
+) -> np.ndarray:
+    """Align *frames* to the first one, writing into the separate stack *out*.
+
+    Like :func:`hdr_utils.align_images` this corrects translation only. The
+    shift is estimated on a reduced-resolution proxy and the warp is applied
+    one band at a time."""
+    h, w = frames.shape[1:3]
+    out[0] = frames[0]
+    for i in range(1, len(frames)):
+        dx, dy = estimate_shift(frames[0], frames[i], max_pixels)
+        for y0, y1 in iter_bands(h, rows):
+            # source rows needed by bilinear sampling of this band
+            s0 = max(0, int(math.floor(y0 + dy)) - 1)
+            s1 = min(h, int(math.ceil(y1 + dy)) + 2)
+            if s1 <= s0:
+                out[i, y0:y1] = 0
+                continue
+            matrix = np.float32([[1, 0, dx], [0, 1, dy + y0 - s0]])
+            cv2.warpAffine(
+                np.ascontiguousarray(frames[i, s0:s1]),
+                matrix,
+                (w, y1 - y0),
+                dst=out[i, y0:y1],
+                flags=cv2.INTER_LINEAR + cv2.WARP_INVERSE_MAP,
+            )
+    return out
+
+
+def remove_ghosts_chunked(
+    frames: np.ndarray, threshold: int = 25, rows: int = DEFAULT_BAND_ROWS
+) -> np.ndarray:
+    """Apply :func:`hdr_utils.remove_ghosts` in place, band by band."""
+    for y0, y1 in iter_bands(frames.shape[1], rows):
+        band = frames[:, y0:y1]
+        remove_ghosts(band, threshold, out=band)
+    return frames
+
+
+def merge_chunked(
+    frames: np.ndarray,
+    exposure_times: Sequence[float],
+    out: np.ndarray,
+    rows: int = DEFAULT_BAND_ROWS,
+) -> np.ndarray:
+    """Run the Debevec merge band by band into the float32 buffer *out*."""
+    for y0, y1 in iter_bands(frames.shape[1], rows):
+        create_hdr([f[y0:y1] for f in frames], exposure_times, out=out[y0:y1])
+    return out
+
+
+def tonemap_chunked(
+    hdr: np.ndarray,
+    out: np.ndarray,
+    reference: Optional[np.ndarray] = None,
+    rows: int = DEFAULT_BAND_ROWS,
+    max_pixels: int = DEFAULT_PROXY_PIXELS,
+    tonemap_func: Callable[..., np.ndarray] = tonemap,
+    **tonemap_options,
+) -> np.ndarray:
+    """Tonemap *hdr* into the uint8 buffer *out* without loading it whole.
+
+    *tonemap_func* (default :func:`hdr_utils.tonemap`) is called as
+    ``tonemap_func(proxy, reference_proxy, **tonemap_options)`` on a
+    reduced-resolution proxy and must return a uint8 image. The ratio
+    between its result and the normalised proxy forms a smooth per-channel
+    gain map, which is upscaled and applied to the full-resolution bands.
+    Local detail comes from the full-resolution HDR; fine-scale CLAHE
+    contrast is only applied at proxy resolution."""
+    h, w = hdr.shape[:2]
+    factor = proxy_factor(hdr.shape, max_pixels)
+    rows = _band_rows(rows, factor)
+
+    lo, hi = np.inf, -np.inf
+    for y0, y1 in iter_bands(h, rows):
+        band = hdr[y0:y1]
+        lo, hi = min(lo, float(band.min())), max(hi, float(band.max()))
+    scale = 1.0 / (hi - lo) if hi > lo else 0.0
+
+    proxy = (downscale(hdr, factor, rows) - lo) * scale
+    ref_proxy = None if reference is None else downscale(reference, factor, rows)
+    ldr_proxy = tonemap_func(proxy.astype(np.float32), ref_proxy, **tonemap_options)
+    eps = 1e-3
+    gain = ((ldr_proxy.astype(np.float32) / 255 + eps) / (proxy + eps)).astype(np.float32)
+
+    for y0, y1 in iter_bands(h, rows):
+        band = (hdr[y0:y1] - lo) * scale
+        band *= _upscale_band(gain, y0, y1, w, factor)
+        np.clip(band * 255, 0, 255, out=band)
+        out[y0:y1] = band.astype(np.uint8)
+    return out
+
+
+def create_hdr_out_of_core(
+    image_paths: List[str],
+    exposure_times: List[float],
+    scratch_dir: str,
+    align: bool = False,
+    deghost: bool = False,
+    rows: int = DEFAULT_BAND_ROWS,
+    tonemap_func: Callable[..., np.ndarray] = tonemap,
+    **tonemap_options,
+) -> SharedArray:
+    """Merge and tonemap brackets that do not fit in RAM.
+
+    Frames are decoded one at a time into an ``np.memmap`` scratch stack in
+    *scratch_dir*, and alignment, deghosting, merging and tone mapping then
+    walk the scratch files in bands of *rows* rows, so peak memory depends
+    on the band size rather than the image size. *tonemap_func* and
+    *tonemap_options* are passed to :func:`tonemap_chunked`. Only the
+    returned LDR handle is kept; the caller must ``unlink()`` it."""
+    frames = load_image_stack(image_paths, scratch_dir)
+    scratch = [frames]
+    try:
+        stack = frames.array()
+        if align and len(stack) > 1:
+            aligned = SharedArray.create(frames.shape, frames.dtype, scratch_dir)
+            scratch.append(aligned)
+            stack = align_chunked(stack, aligned.array(), rows)
+        if deghost and len(stack) > 1:
+            remove_ghosts_chunked(stack, rows=rows)
+
+        hdr = SharedArray.create(frames.shape[1:], np.float32, scratch_dir)
+        scratch.append(hdr)
+        merge_chunked(stack, exposure_times, hdr.array(), rows)
+
+        order = sorted(range(len(exposure_times)), key=lambda i: exposure_times[i])
+        reference = stack[order[len(order) // 2]]
+        ldr = SharedArray.create(frames.shape[1:], np.uint8, scratch_dir)
+        try:
+            tonemap_chunked(
+                hdr.array(),
+                ldr.array(),
+                reference,
+                rows,
+                tonemap_func=tonemap_func,
+                **tonemap_options,
+            )
+            ldr.array().flush()
+        except BaseException:
+            ldr.unlink()
+            raise
+        return ldr
+    finally:
+        for handle in scratch:
+            handle.unlink()
@@ -0,0 +1,160 @@
+import os
+import secrets
+import threading
+import cv2
+import numpy as np
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
+
+
+_SUBSAMPLING = {
+    "444": "IMWRITE_JPEG_SAMPLING_FACTOR_444",
+    "422": "IMWRITE_JPEG_SAMPLING_FACTOR_422",
+    "420": "IMWRITE_JPEG_SAMPLING_FACTOR_420",
+}
+
+WEB_FORMATS = ("webp", "png")
+
+
+def encode_params(
+    path: str,
+    quality: int = 95,
+    progressive: bool = False,
+    subsampling: Optional[str] = None,
+) -> List[int]:
+    """Return ``cv2.imwrite`` parameters for the format implied by *path*."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".jpg", ".jpeg"):
+        params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+        if progressive:
+            params += [cv2.IMWRITE_JPEG_PROGRESSIVE, 1]
+        if subsampling is not None:
+            if subsampling not in _SUBSAMPLING:
+                raise ValueError(f"Unknown chroma subsampling: {subsampling}")
+            factor = getattr(cv2, _SUBSAMPLING[subsampling], None)
+            if factor is not None:  # not available on older OpenCV builds
+                params += [cv2.IMWRITE_JPEG_SAMPLING_FACTOR, factor]
+        return params
+    if ext == ".webp":
+        return [cv2.IMWRITE_WEBP_QUALITY, int(quality)]
+    if ext == ".png":
+        return [cv2.IMWRITE_PNG_COMPRESSION, 3]
+    return []
+
+
+def write_image(path: str, image: np.ndarray, **options) -> str:
+    """Encode *image* to *path* atomically.
+
+    The data is written to a temporary file in the target directory and
+    renamed into place, so readers never see a partially written file. The
+    file gets the usual ``0o666 & ~umask`` permissions (``mkstemp`` would
+    leave it owner-only)."""
+    directory, name = os.path.split(os.path.abspath(path))
+    root, ext = os.path.splitext(name)
+    while True:
+        tmp_path = os.path.join(directory, f".{root}.{secrets.token_hex(4)}{ext}")
+        try:
+            fd = os.open(tmp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666)
+        except FileExistsError:
+            continue
+        os.close(fd)
+        break
+    try:
+        if not cv2.imwrite(tmp_path, image, encode_params(path, **options)):
+            raise IOError(f"Could not encode image to {path}")
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def _resize_max(image: np.ndarray, max_size: int) -> np.ndarray:
+    """Downscale *image* so its longest edge is at most *max_size*."""
+    h, w = image.shape[:2]
+    scale = max_size / max(h, w)
+    if scale >= 1.0:
+        return image
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def write_outputs(
+    image: np.ndarray,
+    path: str,
+    *,
+    quality: int = 95,
+    progressive: bool = False,
+    subsampling: Optional[str] = None,
+    web_format: Optional[str] = None,
+    web_size: int = 2048,
+    thumbnail_size: int = 0,
+) -> List[str]:
+    """Write *image* to *path* plus optional web copy and thumbnail.
+
+    All outputs are derived from the same in-memory LDR image. The web copy
+    is saved as ``<stem>_web.<web_format>`` and the thumbnail as
+    ``<stem>_thumb.jpg`` next to *path*. Returns the written paths."""
+    if web_format is not None and web_format not in WEB_FORMATS:
+        raise ValueError(f"Unknown web format: {web_format}")
+    stem = os.path.splitext(path)[0]
+    written = [
+        write_image(
+            path, image, quality=quality, progressive=progressive, subsampling=subsampling
+        )
+    ]
+    if web_format:
+        web_path = f"{stem}_web.{web_format}"
+        written.append(write_image(web_path, _resize_max(image, web_size), quality=quality))
+    if thumbnail_size > 0:
+        thumb_path = f"{stem}_thumb.jpg"
+        thumb = _resize_max(image, thumbnail_size)
+        written.append(write_image(thumb_path, thumb, quality=85, subsampling="420"))
+    return written
+
+
+class OutputWriter:
+    """Background pool that encodes images while the caller keeps computing.
+
+    At most *max_pending* images are queued; :meth:`submit` blocks when the
+    limit is reached so memory stays bounded in long batch runs."""
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 4, **options):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._slots = threading.Semaphore(max_pending)
+        self._futures: List[Future] = []
+        self.options = options
+
+    def submit(self, image: np.ndarray, path: str, **options) -> Future:
+        """Queue *image* for :func:`write_outputs` and return its future."""
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(
+                write_outputs, image, path, **{**self.options, **options}
+            )
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+        return future
+
+    def close(self) -> List[str]:
+        """Wait for all queued writes and return every written path.
+
+        The first encoding error is re-raised after the pool has drained."""
+        self._pool.shutdown(wait=True)
+        written: List[str] = []
+        for future in self._futures:
+            written.extend(future.result())
+        return written
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._pool.shutdown(wait=True)
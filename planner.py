@@ -0,0 +1,350 @@
+import os
+import math
+import struct
+import threading
+from fractions import Fraction
+from typing import NamedTuple, Optional, Sequence, Tuple
+
+# Largest image used for reduced-resolution alignment and deghost masks.
+PROXY_PIXELS = 4_000_000
+# Rough single-thread cost of each stage in seconds per megapixel and frame.
+STAGE_SECONDS = {
+    "decode": 0.010,
+    "align": 0.050,
+    "deghost": 0.080,
+    "merge": 0.020,
+    "tonemap": 0.150,
+}
+# Stages that OpenCV parallelises internally; the others are numpy bound.
+PARALLEL_STAGES = ("align", "merge", "tonemap")
+OUT_OF_CORE_BAND_ROWS = 256
+OUT_OF_CORE_SLOWDOWN = 1.5
+
+
+def proxy_factor(shape: Sequence[int], max_pixels: int = PROXY_PIXELS) -> int:
+    """Return the integer downscale factor that fits *max_pixels*."""
+    return max(1, math.ceil(math.sqrt(shape[0] * shape[1] / max_pixels)))
+
+
+class ExecutionPlan(NamedTuple):
+    """Strategy chosen by :func:`plan_job` for one bracket."""
+
+    strategy: str  # "whole-frame" or "out-of-core"
+    threads: int
+    workers: int  # brackets of this size that fit side by side
+    proxy_pixels: Optional[int]  # reduced resolution for align/deghost
+    peak_memory: int
+    seconds: float
+
+    def describe(self) -> str:
+        proxy = "full" if self.proxy_pixels is None else f"{self.proxy_pixels / 1e6:.0f}MP"
+        return (
+            f"strategy={self.strategy} threads={self.threads} workers={self.workers} "
+            f"align/deghost={proxy} memory={self.peak_memory / 2**20:.0f}MB "
+            f"time={self.seconds:.1f}s"
+        )
+
+
+def _jpeg_size(fh) -> Optional[Tuple[int, int]]:
+    fh.seek(2)
+    while True:
+        byte = fh.read(1)
+        while byte and byte != b"\xff":
+            byte = fh.read(1)
+        while byte == b"\xff":
+            byte = fh.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker == 0xD9:  # end of image before any frame header
+            return None
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+            continue  # markers without a length field
+        length = struct.unpack(">H", fh.read(2))[0]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">xHH", fh.read(5))
+            return width, height
+        fh.seek(length - 2, os.SEEK_CUR)
+
+
+def _tiff_size(fh, order: str) -> Optional[Tuple[int, int]]:
+    fh.seek(4)
+    fh.seek(struct.unpack(order + "I", fh.read(4))[0])
+    size = {}
+    for _ in range(struct.unpack(order + "H", fh.read(2))[0]):
+        tag, kind, _count, value = struct.unpack(order + "HHI4s", fh.read(12))
+        if tag in (256, 257):
+            fmt = "H2x" if kind == 3 else "I"
+            size[tag] = struct.unpack(order + fmt, value)[0]
+    if 256 in size and 257 in size:
+        return size[256], size[257]
+    return None
+
+
+def read_image_size(path: str) -> Optional[Tuple[int, int]]:
+    """Return ``(width, height)`` parsed from the JPEG, PNG or TIFF header.
+
+    Only the first few kilobytes are read, so this is far cheaper than a
+    decode. Returns None for unknown or unreadable files."""
+    try:
+        with open(path, "rb") as fh:
+            head = fh.read(8)
+            if head.startswith(b"\xff\xd8"):
+                return _jpeg_size(fh)
+            if head == b"\x89PNG\r\n\x1a\n":
+                fh.seek(16)
+                return struct.unpack(">II", fh.read(8))
+            if head[:4] in (b"II*\x00", b"MM\x00*"):
+                return _tiff_size(fh, "<" if head[:2] == b"II" else ">")
+    except (OSError, struct.error):
+        pass
+    return None
+
+
+def read_frame_size(paths: Sequence[str]) -> Optional[Tuple[int, int]]:
+    """Return the largest frame size among *paths*, or None if any is unknown."""
+    sizes = [read_image_size(p) for p in paths]
+    if not sizes or None in sizes:
+        return None
+    return max(sizes, key=lambda s: s[0] * s[1])
+
+
+def available_memory() -> Optional[int]:
+    """Return the memory available to new allocations in bytes, if known."""
+    try:
+        with open("/proc/meminfo") as fh:
+            for line in fh:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def _cgroup_cpu_quota() -> Optional[float]:
+    try:  # cgroup v2: "<quota> <period>" or "max <period>"
+        with open("/sys/fs/cgroup/cpu.max") as fh:
+            quota, period = fh.read().split()[:2]
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:  # cgroup v1: a quota of -1 means unlimited
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as fh:
+            quota = int(fh.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as fh:
+            period = int(fh.read())
+        return None if quota <= 0 else quota / period
+    except (OSError, ValueError):
+        return None
+
+
+def available_cpus() -> int:
+    """Return the number of CPUs this process may use.
+
+    Honours the CPU affinity mask and a container CPU quota, both of which
+    ``os.cpu_count()`` ignores."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        cpus = os.cpu_count() or 1
+    quota = _cgroup_cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, math.ceil(quota))
+    return max(1, cpus)
+
+
+def _cgroup_memory_limit() -> Optional[int]:
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as fh:
+                value = fh.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < 2**60:  # v1 reports "no limit" as a huge number
+            return int(value)
+    return None
+
+
+def total_memory() -> Optional[int]:
+    """Return the physical memory usable by this process in bytes, if known.
+
+    This is the installed RAM, capped by a container memory limit. Unlike
+    :func:`available_memory` it does not change with the machine's load."""
+    total = None
+    try:
+        total = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        pass
+    limit = _cgroup_memory_limit()
+    if limit is not None and (total is None or limit < total):
+        total = limit
+    return total
+
+
+def parse_size(value: str) -> int:
+    """Parse a byte count such as ``"512M"`` or ``"8G"``."""
+    units = {"K": 2**10, "M": 2**20, "G": 2**30, "T": 2**40}
+    value = value.strip().upper().rstrip("B")
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def estimate_seconds(
+    width: int,
+    height: int,
+    frames: int,
+    align: bool = False,
+    deghost: bool = False,
+    proxy_pixels: Optional[int] = None,
+    threads: int = 1,
+) -> float:
+    """Return a rough wall-clock estimate for merging one bracket."""
+    mp = width * height / 1e6
+    reduced = min(mp, proxy_pixels / 1e6) if proxy_pixels else mp
+    work = {
+        "decode": STAGE_SECONDS["decode"] * mp * frames,
+        "merge": STAGE_SECONDS["merge"] * mp * frames,
+        "tonemap": STAGE_SECONDS["tonemap"] * mp,
+    }
+    if align:
+        work["align"] = STAGE_SECONDS["align"] * reduced * frames
+    if deghost:
+        work["deghost"] = STAGE_SECONDS["deghost"] * reduced * frames
+    return sum(t / threads if s in PARALLEL_STAGES else t for s, t in work.items())
+
+
+def estimate_peak_memory(
+    width: int,
+    height: int,
+    frames: int,
+    align: bool = False,
+    deghost: bool = False,
+    proxy_pixels: Optional[int] = None,
+) -> int:
+    """Return a rough estimate in bytes of the peak memory for one merge.
+
+    The decoded uint8 frames stay alive for the whole job; on top of that
+    the largest stage (alignment, deghosting, Debevec merge or tone mapping)
+    determines the peak. *proxy_pixels* models alignment and deghost masks
+    computed at reduced resolution."""
+    pixels = width * height
+    small = min(pixels, proxy_pixels) if proxy_pixels else pixels
+    frame_bytes = pixels * 3
+    float_bytes = pixels * 3 * 4
+    stages = [
+        float_bytes * 3,  # merge: radiance map plus weight buffers
+        float_bytes * 4,  # tone mapping: normalised copies and LDR result
+    ]
+    if align:
+        stages.append(frames * frame_bytes + small * 4 * 2)
+    if deghost:
+        work = frames * (small * 12 * 2 + small * 4 + small * 3) + small * 12
+        if small < pixels:
+            work += frames * (frame_bytes + pixels)  # full-size outputs and masks
+        stages.append(work)
+    return frames * frame_bytes + max(stages)
+
+
+def _out_of_core_memory(width: int, height: int, frames: int) -> int:
+    band = OUT_OF_CORE_BAND_ROWS * width
+    return (
+        width * height * 3  # one decoded frame while filling the scratch stack
+        + frames * (band * 12 * 2 + band * 7) + band * 12  # deghost band
+        + PROXY_PIXELS * 12 * 4  # tonemapped proxy and gain map
+    )
+
+
+def plan_job(
+    width: int,
+    height: int,
+    frames: int,
+    align: bool = False,
+    deghost: bool = False,
+    memory_budget: Optional[int] = None,
+    latency_budget: Optional[float] = None,
+    cpu_count: Optional[int] = None,
+    out_of_core: bool = False,
+    max_workers: int = 1,
+) -> ExecutionPlan:
+    """Choose how to merge a *frames* x *width* x *height* bracket.
+
+    Alignment and deghost masks drop to :data:`PROXY_PIXELS` when the full
+    resolution would exceed *memory_budget* (default: 80% of the available
+    memory) or *latency_budget* seconds. The out-of-core pipeline is chosen
+    when the job still exceeds an explicit *memory_budget* or, without one,
+    the total physical memory, so the strategy never depends on the current
+    load of the machine. *out_of_core* forces it.
+
+    Up to *max_workers* brackets like this one may run side by side while
+    they fit the memory budget together; the usable CPUs (default:
+    :func:`available_cpus`) are split between them."""
+    cpus = cpu_count or available_cpus()
+    if memory_budget is None:
+        available = available_memory()
+        memory_budget = int(available * 0.8) if available else None
+        out_of_core_limit = total_memory()
+    else:
+        out_of_core_limit = memory_budget
+
+    def over_budget(peak, seconds):
+        return (memory_budget is not None and peak > memory_budget) or (
+            latency_budget is not None and seconds > latency_budget
+        )
+
+    proxy = None
+    peak = estimate_peak_memory(width, height, frames, align, deghost)
+    seconds = estimate_seconds(width, height, frames, align, deghost, None, cpus)
+    if (align or deghost) and width * height > PROXY_PIXELS and over_budget(peak, seconds):
+        proxy = PROXY_PIXELS
+        peak = estimate_peak_memory(width, height, frames, align, deghost, proxy)
+
+    strategy = "whole-frame"
+    slowdown = 1.0
+    if out_of_core or (out_of_core_limit is not None and peak > out_of_core_limit):
+        strategy = "out-of-core"
+        proxy = PROXY_PIXELS if align else None
+        peak = _out_of_core_memory(width, height, frames)
+        slowdown = OUT_OF_CORE_SLOWDOWN
+
+    workers = max(1, min(max_workers, cpus))
+    if memory_budget is not None:
+        workers = max(1, min(workers, memory_budget // max(peak, 1)))
+    threads = max(1, cpus // workers)
+    seconds = slowdown * estimate_seconds(width, height, frames, align, deghost, proxy, threads)
+    return ExecutionPlan(strategy, threads, workers, proxy, peak, seconds)
+
+
+def apply_threads(plan: ExecutionPlan) -> None:
+    """Configure OpenCV's thread pool for *plan*."""
+    import cv2
+
+    cv2.setNumThreads(plan.threads)
+
+
+class WorkerSlots:
+    """Admit brackets to run side by side as far as their plans allow.
+
+    A plan with ``workers=n`` takes ``1/n`` of the machine, so up to *n*
+    such brackets run at once; a bracket that needs the whole machine waits
+    until the others have finished."""
+
+    def __init__(self):
+        self._used = Fraction(0)
+        self._cond = threading.Condition()
+
+    def acquire(self, plan: Optional[ExecutionPlan]) -> Fraction:
+        """Block until *plan* fits and return the share it took."""
+        share = Fraction(1, plan.workers) if plan is not None else Fraction(1)
+        with self._cond:
+            self._cond.wait_for(lambda: not self._used or self._used + share <= 1)
+            self._used += share
+        return share
+
+    def release(self, share: Fraction) -> None:
+        with self._cond:
+            self._used -= share
+            self._cond.notify_all()
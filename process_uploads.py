@@ -1,24 +1,26 @@
 import sys
 import os
-import cv2
-import numpy as np
 import argparse
 try:  # allow usage both as script and module
     from .find_and_merge_aeb import (
         find_aeb_images_and_exposure_times_from_list,
         load_images,
         create_hdr,
+        plan_group,
+        scan_groups,
     )
-    from .hdr_utils import get_medium_exposure_image, tonemap
+    from .planner import apply_threads, parse_size
 except ImportError:  # pragma: no cover - fallback for direct execution
     from find_and_merge_aeb import (
         find_aeb_images_and_exposure_times_from_list,
         load_images,
         create_hdr,
+        plan_group,
+        scan_groups,
     )
-    from hdr_utils import get_medium_exposure_image, tonemap
+    from planner import apply_threads, parse_size
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description="Process uploaded images")
     parser.add_argument("paths", nargs="+", help="input images followed by output path")
     parser.add_argument("--align", action="store_true", help="auto align images")
@@ -33,7 +35,40 @@ def main():
         default="mantiuk",
         help="tone mapping algorithm",
     )
-    args = parser.parse_args()
+    parser.add_argument("--quality", type=int, default=95, help="JPEG/WebP quality")
+    parser.add_argument("--progressive", action="store_true", help="write a progressive JPEG")
+    parser.add_argument("--subsampling", choices=["444", "422", "420"], help="JPEG chroma subsampling")
+    parser.add_argument("--web-format", choices=["webp", "png"], help="also write a web copy")
+    parser.add_argument("--thumbnail", type=int, default=0, help="also write a thumbnail of this size")
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="treat all paths as inputs and only report the estimated work",
+    )
+    parser.add_argument(
+        "--out-of-core",
+        action="store_true",
+        help="keep frames and HDR data in memory-mapped scratch files",
+    )
+    parser.add_argument(
+        "--scratch-dir",
+        help="directory for out-of-core scratch files (default: next to the output)",
+    )
+    parser.add_argument("--memory-budget", type=parse_size, help="memory budget, e.g. 8G")
+    parser.add_argument("--latency-budget", type=float, help="target processing time in seconds")
+    args = parser.parse_args(argv)
+
+    if args.dry_run:
+        aeb_images, exposure_times = find_aeb_images_and_exposure_times_from_list(args.paths)
+        scan_groups(
+            [(aeb_images, exposure_times)] if aeb_images else [],
+            args.align,
+            args.deghost,
+            memory_budget=args.memory_budget,
+            latency_budget=args.latency_budget,
+            out_of_core=args.out_of_core,
+        )
+        return
 
     if len(args.paths) < 2:
         print("Usage: process_uploads.py [--align] [--deghost] <image1> [<image2> ...] <output>")
@@ -45,26 +80,78 @@ def main():
         print("No AEB-tagged images found", file=sys.stderr)
         sys.exit(1)
 
+    try:  # OpenCV is only needed once pixel work starts
+        from .hdr_utils import get_medium_exposure_image, tonemap
+        from .output_writer import write_outputs
+    except ImportError:  # pragma: no cover - fallback for direct execution
+        from hdr_utils import get_medium_exposure_image, tonemap
+        from output_writer import write_outputs
+
     def progress(pct: int):
         print(f"PROGRESS {pct}", flush=True)
 
-    progress(10)
-    images = load_images(aeb_images)
-    progress(40)
-    hdr = create_hdr(images, exposure_times, align=args.align, deghost=args.deghost)
-    progress(70)
-    ref_image = get_medium_exposure_image(images, exposure_times)
-    ldr = tonemap(
-        hdr,
-        ref_image,
+    tonemap_options = dict(
         algorithm=args.algorithm,
         saturation=args.saturation,
         contrast=args.contrast,
         gamma=args.gamma,
         brightness=args.brightness,
     )
+    output_options = dict(
+        quality=args.quality,
+        progressive=args.progressive,
+        subsampling=args.subsampling,
+        web_format=args.web_format,
+        thumbnail_size=args.thumbnail,
+    )
+
+    plan = plan_group(
+        aeb_images,
+        args.align,
+        args.deghost,
+        memory_budget=args.memory_budget,
+        latency_budget=args.latency_budget,
+        out_of_core=args.out_of_core,
+    )
+    if plan is not None:
+        print(f"PLAN {plan.describe()}", flush=True)
+        apply_threads(plan)
+
+    progress(10)
+    if args.out_of_core or (plan is not None and plan.strategy == "out-of-core"):
+        try:
+            from .out_of_core import create_hdr_out_of_core, scratch_directory
+        except ImportError:  # pragma: no cover - fallback for direct execution
+            from out_of_core import create_hdr_out_of_core, scratch_directory
+
+        with create_hdr_out_of_core(
+            aeb_images,
+            exposure_times,
+            scratch_directory(args.scratch_dir, os.path.dirname(os.path.abspath(output_path))),
+            align=args.align,
+            deghost=args.deghost,
+            **tonemap_options,
+        ) as ldr:
+            progress(90)
+            write_outputs(ldr.array(), output_path, **output_options)
+        progress(100)
+        print(output_path)
+        return
+
+    images = load_images(aeb_images)
+    progress(40)
+    hdr = create_hdr(
+        images,
+        exposure_times,
+        align=args.align,
+        deghost=args.deghost,
+        max_pixels=plan.proxy_pixels if plan else None,
+    )
+    progress(70)
+    ref_image = get_medium_exposure_image(images, exposure_times)
+    ldr = tonemap(hdr, ref_image, **tonemap_options)
     progress(90)
-    cv2.imwrite(output_path, ldr)
+    write_outputs(ldr, output_path, **output_options)
     progress(100)
     print(output_path)
 
@@ -0,0 +1,118 @@
+import os
+import tempfile
+import numpy as np
+from multiprocessing import shared_memory
+from typing import Optional, Sequence
+
+
+class SharedArray:
+    """Picklable handle to an ndarray shared between processes.
+
+    The data lives either in a ``multiprocessing.shared_memory`` segment or,
+    when *scratch_dir* is given, in an mmap-backed scratch file. Only the
+    name, shape and dtype travel between processes; each process calls
+    :meth:`array` to map the same memory without copying. The creating
+    process owns the buffer and must call :meth:`unlink` (or use the handle
+    as a context manager) once every stage is finished."""
+
+    def __init__(self, shape: Sequence[int], dtype, name: str, path: Optional[str] = None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.name = name
+        self.path = path
+        self._shm = None
+        self._array = None
+        self._owner = False
+
+    @classmethod
+    def create(
+        cls, shape: Sequence[int], dtype, scratch_dir: Optional[str] = None
+    ) -> "SharedArray":
+        """Allocate a new zero-initialised buffer."""
+        shape = tuple(int(s) for s in shape)
+        nbytes = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        if scratch_dir is not None:
+            fd, path = tempfile.mkstemp(prefix="hdr-", suffix=".buf", dir=scratch_dir)
+            os.ftruncate(fd, nbytes)
+            os.close(fd)
+            handle = cls(shape, dtype, os.path.basename(path), path)
+        else:
+            shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            handle = cls(shape, dtype, shm.name)
+            handle._shm = shm
+        handle._owner = True
+        return handle
+
+    @classmethod
+    def from_array(cls, data: np.ndarray, scratch_dir: Optional[str] = None) -> "SharedArray":
+        """Allocate a buffer shaped like *data* and copy it in."""
+        handle = cls.create(data.shape, data.dtype, scratch_dir)
+        np.copyto(handle.array(), data)
+        return handle
+
+    def array(self) -> np.ndarray:
+        """Return an ndarray view of the shared data, attaching if needed."""
+        if self._array is None:
+            if self.path is not None:
+                self._array = np.memmap(self.path, dtype=self.dtype, mode="r+", shape=self.shape)
+            else:
+                if self._shm is None:
+                    try:  # Python 3.13+: attaching must not take ownership
+                        self._shm = shared_memory.SharedMemory(name=self.name, track=False)
+                    except TypeError:
+                        self._shm = shared_memory.SharedMemory(name=self.name)
+                self._array = np.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf)
+        return self._array
+
+    def close(self) -> None:
+        """Detach this process from the buffer.
+
+        Views returned by :meth:`array` that are still referenced keep the
+        mapping alive until they are garbage collected."""
+        self._array = None
+        if self._shm is not None:
+            try:
+                self._shm.close()
+            except BufferError:  # numpy views still exported
+                pass
+            self._shm = None
+
+    def release(self) -> None:
+        """Detach unless this process created the buffer.
+
+        Pipeline stages call this when done so worker processes do not keep
+        mappings of finished groups alive."""
+        if not self._owner:
+            self.close()
+
+    def unlink(self) -> None:
+        """Detach and free the buffer. Only the creating process should call this."""
+        if self.path is not None:
+            self.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        shm = self._shm
+        if shm is None:
+            try:
+                shm = shared_memory.SharedMemory(name=self.name)
+            except FileNotFoundError:
+                return
+        shm.unlink()
+        self._shm = shm
+        self.close()
+
+    def __getstate__(self):
+        return {"shape": self.shape, "dtype": self.dtype.str, "name": self.name, "path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["shape"], state["dtype"], state["name"], state["path"])
+
+    def __enter__(self) -> "SharedArray":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._owner:
+            self.unlink()
+        else:
+            self.close()
@@ -24,3 +24,63 @@ def test_group_images_by_datetime(monkeypatch):
 
     groups = group_images_by_datetime(list(dates.keys()), threshold=datetime.timedelta(seconds=2))
     assert groups == [["img1.jpg", "img2.jpg"], ["img3.jpg", "img4.jpg"]]
+
+
+def test_iter_image_files_recursive_with_globs(tmp_path):
+    (tmp_path / "card" / "DCIM").mkdir(parents=True)
+    (tmp_path / "skip").mkdir()
+    for name in ("a.jpg", "notes.txt", "card/DCIM/b.JPG", "card/DCIM/c.tif", "skip/d.jpg"):
+        (tmp_path / name).write_bytes(b"")
+
+    found = list(find_and_merge_aeb.iter_image_files(str(tmp_path), exclude=["skip"]))
+    assert [Path(p).name for p in found] == ["a.jpg", "b.JPG", "c.tif"]
+
+    only_jpg = find_and_merge_aeb.iter_image_files(str(tmp_path), include=["*.jpg"])
+    assert [Path(p).name for p in only_jpg] == ["a.jpg", "b.JPG", "d.jpg"]
+
+    flat = find_and_merge_aeb.iter_image_files(str(tmp_path), recursive=False)
+    assert [Path(p).name for p in flat] == ["a.jpg"]
+
+
+def test_discover_aeb_groups_streams_batches(monkeypatch, tmp_path):
+    meta = {
+        "img1.jpg": ("2023:01:01 12:00:00", "1/60"),
+        "img2.jpg": ("2023:01:01 12:00:01", "1/30"),
+        "img3.jpg": ("2023:01:01 12:00:05", "1/60"),
+        "img4.jpg": ("2023:01:01 12:00:06", "bad"),
+    }
+    calls = []
+
+    def fake_exif(paths, tags):
+        calls.append(list(paths))
+        return [
+            {
+                "SourceFile": p,
+                "XPKeywords": "AEB",
+                "DateTimeOriginal": meta[Path(p).name][0],
+                "ExposureTime": meta[Path(p).name][1],
+            }
+            for p in paths
+        ]
+
+    for name in meta:
+        (tmp_path / name).write_bytes(b"")
+    monkeypatch.setattr(find_and_merge_aeb, "_run_exiftool_json", fake_exif)
+
+    groups = find_and_merge_aeb.discover_aeb_groups(str(tmp_path), batch_size=2)
+    first = next(groups)
+    assert [Path(p).name for p in first[0]] == ["img1.jpg", "img2.jpg"]
+    assert first[1] == [1 / 60, 1 / 30]
+    assert len(calls) == 2  # second batch needed to close the first window
+    rest = list(groups)
+    assert [[Path(p).name for p in g] for g, _ in rest] == [["img3.jpg"]]
+
+
+def test_iter_bracket_groups_window_starts_at_first_frame():
+    start = datetime.datetime(2023, 1, 1, 12, 0, 0)
+    # ten frames 1.5 s apart: each bracket spans at most 2 s from its first frame
+    meta = [
+        (f"f{i}.jpg", start + datetime.timedelta(seconds=1.5 * i), 1 / 60) for i in range(10)
+    ]
+    groups = find_and_merge_aeb.iter_bracket_groups(meta, datetime.timedelta(seconds=2))
+    assert [len(paths) for paths, _ in groups] == [2, 2, 2, 2, 2]
@@ -0,0 +1,62 @@
+import os
+import sys
+import json
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT.parent))
+
+import HDR_Compositor.find_and_merge_aeb as find_and_merge_aeb
+import HDR_Compositor.process_uploads as process_uploads
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"elapsed": elapsed, "cv2": "cv2" in sys.modules, "numpy": "numpy" in sys.modules}}))
+"""
+
+
+def _import_probe(module):
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)}
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module)],
+        stdout=subprocess.PIPE,
+        text=True,
+        env=env,
+        check=True,
+    )
+    return json.loads(out.stdout)
+
+
+def test_cli_modules_import_without_opencv():
+    for module in ("HDR_Compositor.find_and_merge_aeb", "HDR_Compositor.process_uploads"):
+        result = _import_probe(module)
+        assert not result["cv2"], module
+        assert not result["numpy"], module
+        # generous bound: the CLI only needs the standard library at import
+        assert result["elapsed"] < 0.5, result
+
+
+def test_lazy_helpers_still_exported():
+    from HDR_Compositor.hdr_utils import align_images
+
+    assert find_and_merge_aeb.align_images is align_images
+
+
+def test_dry_run_reports_groups(monkeypatch, capsys):
+    def fake_exif(paths, tags):
+        if "ImageWidth" in tags:
+            return [{"SourceFile": p, "ImageWidth": 4000, "ImageHeight": 3000} for p in paths]
+        return [
+            {"SourceFile": "a.jpg", "XPKeywords": "AEB", "ExposureTime": "1/60"},
+            {"SourceFile": "b.jpg", "XPKeywords": "AEB", "ExposureTime": "1/15"},
+        ]
+
+    monkeypatch.setattr(find_and_merge_aeb, "_run_exiftool_json", fake_exif)
+    process_uploads.main(["--dry-run", "--deghost", "a.jpg", "b.jpg"])
+    out = capsys.readouterr().out
+    assert "Group 1: 2 frames (1/60, 1/15 s), 4000x3000, 24.0 MP" in out
+    assert "Total: 1 groups" in out
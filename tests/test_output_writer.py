@@ -0,0 +1,75 @@
+import os
+import stat
+import sys
+from pathlib import Path
+import numpy as np
+import cv2
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT.parent))
+
+from HDR_Compositor.output_writer import OutputWriter, write_image, write_outputs, encode_params
+
+
+def test_write_outputs_multiple_formats(tmp_path):
+    img = np.random.randint(0, 255, (60, 80, 3), dtype=np.uint8)
+    out = tmp_path / "result.jpg"
+    written = write_outputs(
+        img,
+        str(out),
+        quality=80,
+        progressive=True,
+        subsampling="444",
+        web_format="png",
+        web_size=40,
+        thumbnail_size=16,
+    )
+    assert written == [str(out), str(tmp_path / "result_web.png"), str(tmp_path / "result_thumb.jpg")]
+    assert cv2.imread(str(out)).shape == img.shape
+    assert cv2.imread(written[1]).shape == (30, 40, 3)
+    assert max(cv2.imread(written[2]).shape[:2]) == 16
+    # temporary files are renamed into place
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(Path(p).name for p in written)
+
+
+def test_write_image_honours_umask(tmp_path):
+    old = os.umask(0o022)
+    try:
+        write_image(str(tmp_path / "out.png"), np.zeros((4, 4, 3), dtype=np.uint8))
+    finally:
+        os.umask(old)
+    assert stat.S_IMODE(os.stat(tmp_path / "out.png").st_mode) == 0o644
+
+
+def test_encode_params_jpeg():
+    params = encode_params("x.jpg", quality=70, progressive=True)
+    assert params[:2] == [cv2.IMWRITE_JPEG_QUALITY, 70]
+    assert cv2.IMWRITE_JPEG_PROGRESSIVE in params
+    assert encode_params("x.png") == [cv2.IMWRITE_PNG_COMPRESSION, 3]
+
+
+def test_output_writer_background(tmp_path):
+    img = np.zeros((8, 8, 3), dtype=np.uint8)
+    with OutputWriter(max_workers=2, max_pending=1, thumbnail_size=4) as writer:
+        futures = [writer.submit(img, str(tmp_path / f"hdr_{i}.jpg")) for i in range(3)]
+    assert all(f.done() for f in futures)
+    assert len(list(tmp_path.glob("*_thumb.jpg"))) == 3
+
+
+def test_batch_reports_failed_writes(monkeypatch, tmp_path, capsys):
+    import HDR_Compositor.find_and_merge_aeb as find_and_merge_aeb
+
+    monkeypatch.setattr(
+        find_and_merge_aeb, "discover_aeb_groups", lambda *a, **k: iter([(["a.jpg"], [1.0])])
+    )
+
+    def merge_group(output_dir, name, paths, times, writer=None, **options):
+        image = np.zeros((4, 4, 3), dtype=np.uint8)
+        return writer.submit(image, str(tmp_path / "missing" / f"{name}.jpg"))
+
+    monkeypatch.setattr(find_and_merge_aeb, "merge_group", merge_group)
+    monkeypatch.setattr(find_and_merge_aeb, "plan_group", lambda *a, **k: None)
+    with pytest.raises(OSError):
+        find_and_merge_aeb.main([str(tmp_path), str(tmp_path)])
+    assert "Group 1: Failed to write HDR image" in capsys.readouterr().out
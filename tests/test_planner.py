@@ -0,0 +1,139 @@
+import sys
+from pathlib import Path
+import numpy as np
+import cv2
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT.parent))
+
+from HDR_Compositor.planner import (
+    PROXY_PIXELS,
+    estimate_peak_memory,
+    parse_size,
+    plan_job,
+    read_image_size,
+)
+from HDR_Compositor.hdr_utils import align_images, remove_ghosts
+
+
+def test_read_image_size_from_headers(tmp_path):
+    img = np.zeros((30, 50, 3), dtype=np.uint8)
+    for ext in ("jpg", "png", "tif"):
+        path = tmp_path / f"img.{ext}"
+        cv2.imwrite(str(path), img)
+        assert read_image_size(str(path)) == (50, 30), ext
+    (tmp_path / "bad.jpg").write_bytes(b"not an image")
+    assert read_image_size(str(tmp_path / "bad.jpg")) is None
+    assert read_image_size(str(tmp_path / "missing.jpg")) is None
+
+
+def test_plan_small_job_runs_whole_frame():
+    plan = plan_job(4000, 3000, 3, align=True, deghost=True, memory_budget=parse_size("16G"), cpu_count=8)
+    assert plan.strategy == "whole-frame"
+    assert plan.proxy_pixels is None
+    assert plan.threads == 8
+    assert "strategy=whole-frame" in plan.describe()
+
+
+def test_plan_adapts_to_budgets():
+    w, h, n = 9000, 6700, 5  # ~60 MP
+    full = estimate_peak_memory(w, h, n, deghost=True)
+    reduced = estimate_peak_memory(w, h, n, deghost=True, proxy_pixels=PROXY_PIXELS)
+    assert reduced < full
+
+    plan = plan_job(w, h, n, deghost=True, memory_budget=reduced + 1, cpu_count=4)
+    assert (plan.strategy, plan.proxy_pixels) == ("whole-frame", PROXY_PIXELS)
+
+    plan = plan_job(w, h, n, deghost=True, memory_budget=parse_size("2G"), cpu_count=4)
+    assert plan.strategy == "out-of-core"
+    assert plan.peak_memory < parse_size("2G")
+
+    plan = plan_job(w, h, n, align=True, memory_budget=parse_size("1T"), latency_budget=0.1, cpu_count=4)
+    assert plan.proxy_pixels == PROXY_PIXELS
+
+    forced = plan_job(4000, 3000, 3, memory_budget=parse_size("16G"), cpu_count=4, out_of_core=True)
+    assert forced.strategy == "out-of-core"
+    assert forced.seconds > plan_job(4000, 3000, 3, memory_budget=parse_size("16G"), cpu_count=4).seconds
+
+
+def test_plan_splits_cpus_between_workers(monkeypatch):
+    import HDR_Compositor.planner as planner
+
+    plan = plan_job(4000, 3000, 3, memory_budget=parse_size("2G"), cpu_count=8, max_workers=8)
+    assert 1 < plan.workers == parse_size("2G") // plan.peak_memory
+    assert plan.threads == 8 // plan.workers
+    assert f"workers={plan.workers}" in plan.describe()
+
+    # a container quota of 1.5 CPUs caps the thread count below the host's
+    monkeypatch.setattr(planner, "_cgroup_cpu_quota", lambda: 1.5)
+    assert planner.available_cpus() <= 2
+    assert plan_job(4000, 3000, 3, memory_budget=parse_size("16G")).threads <= 2
+
+
+def test_worker_slots_admit_plans_side_by_side():
+    import threading
+    from HDR_Compositor.planner import WorkerSlots
+
+    half = plan_job(4000, 3000, 3, memory_budget=parse_size("2G"), cpu_count=2, max_workers=2)
+    assert half.workers == 2
+    slots = WorkerSlots()
+    first, second = slots.acquire(half), slots.acquire(half)  # both fit at once
+    admitted = threading.Event()
+    waiter = threading.Thread(target=lambda: (slots.acquire(None), admitted.set()))
+    waiter.start()
+    assert not admitted.wait(0.1)  # a whole-machine job waits for both
+    slots.release(first)
+    assert not admitted.wait(0.1)
+    slots.release(second)
+    assert admitted.wait(1)
+    waiter.join()
+
+
+def test_default_budget_switches_only_above_physical_memory(monkeypatch):
+    import HDR_Compositor.planner as planner
+
+    monkeypatch.setattr(planner, "available_memory", lambda: parse_size("1G"))
+    monkeypatch.setattr(planner, "total_memory", lambda: parse_size("16G"))
+    # over 80% of the free memory, but fits in RAM: a busy machine does not
+    # push the job into the slower pipeline
+    plan = plan_job(9000, 6700, 5, deghost=True, cpu_count=4)
+    assert (plan.strategy, plan.proxy_pixels) == ("whole-frame", PROXY_PIXELS)
+
+    # larger than the machine's RAM: out-of-core without --memory-budget
+    plan = plan_job(30_000, 20_000, 5, deghost=True, cpu_count=4)
+    assert plan.strategy == "out-of-core"
+    assert plan.peak_memory < parse_size("16G")
+
+
+def test_reduced_resolution_align_and_deghost():
+    img1 = np.zeros((40, 40, 3), dtype=np.uint8)
+    cv2.rectangle(img1, (10, 10), (29, 29), (255, 255, 255), -1)
+    img2 = np.roll(img1, 4, axis=1)
+    aligned = align_images([img1, img2], max_pixels=400)
+    diff = np.abs(aligned[0].astype(int) - aligned[1].astype(int)).sum()
+    assert diff < np.abs(img1.astype(int) - img2.astype(int)).sum() / 4
+
+    ghosted = img1.copy()
+    ghosted[0:4, 0:4] = [0, 0, 255]
+    deghosted = remove_ghosts([img1, ghosted, img1], threshold=10, max_pixels=400)
+    assert np.array_equal(deghosted[1][0:4, 0:4], img1[0:4, 0:4])
+
+
+def test_batch_merges_groups_concurrently(monkeypatch, tmp_path):
+    import threading
+    import HDR_Compositor.find_and_merge_aeb as find_and_merge_aeb
+
+    groups = [([f"g{i}.jpg"], [1.0]) for i in range(2)]
+    plan = plan_job(4000, 3000, 3, memory_budget=parse_size("2G"), cpu_count=2, max_workers=2)
+    monkeypatch.setattr(find_and_merge_aeb, "discover_aeb_groups", lambda *a, **k: iter(groups))
+    monkeypatch.setattr(find_and_merge_aeb, "plan_group", lambda *a, **k: plan)
+    monkeypatch.setattr(find_and_merge_aeb, "available_cpus", lambda: 2)
+    both_running = threading.Barrier(2, timeout=5)
+
+    def merge_group(output_dir, name, paths, times, writer=None, plan=None, **options):
+        assert plan.workers == 2
+        both_running.wait()  # raises BrokenBarrierError if the groups ran one by one
+        return [f"{name}.jpg"]
+
+    monkeypatch.setattr(find_and_merge_aeb, "merge_group", merge_group)
+    find_and_merge_aeb.main([str(tmp_path), str(tmp_path)])
@@ -0,0 +1,54 @@
+import sys
+import pickle
+import multiprocessing
+from pathlib import Path
+import numpy as np
+import cv2
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT.parent))
+
+from HDR_Compositor.shared_buffers import SharedArray
+from HDR_Compositor.hdr_utils import align_images, remove_ghosts, tonemap
+from HDR_Compositor.find_and_merge_aeb import create_hdr, load_image_stack, merge_shared
+
+
+def _bracket():
+    base = np.zeros((16, 20, 3), dtype=np.uint8)
+    cv2.rectangle(base, (4, 4), (12, 10), (200, 180, 160), -1)
+    return [np.clip(base.astype(int) + v, 0, 255).astype(np.uint8) for v in (10, 40, 70)]
+
+
+def test_align_and_deghost_write_into_buffer():
+    images = _bracket()
+    images[1] = np.roll(images[1], 1, axis=1)
+    stack = np.stack(images)
+    expected = remove_ghosts(align_images(images))
+    result = remove_ghosts(align_images(stack, out=stack), out=stack)
+    assert all(np.shares_memory(r, stack) for r in result)
+    assert np.array_equal(stack, np.stack(expected))
+
+
+def test_merge_shared_in_other_process(tmp_path):
+    images = _bracket()
+    images[1] = np.roll(images[1], 1, axis=1)  # alignment rewrites the reference frame
+    times = [1 / 30, 1 / 60, 1 / 125]
+    paths = []
+    for i, img in enumerate(images):
+        paths.append(str(tmp_path / f"f{i}.png"))
+        cv2.imwrite(paths[-1], img)
+    expected_hdr = create_hdr(images, times, align=True, deghost=True)
+    expected_ldr = tonemap(expected_hdr, images[1])
+
+    for scratch_dir in (None, str(tmp_path)):
+        frames = load_image_stack(paths, scratch_dir)
+        with frames, SharedArray.create(expected_hdr.shape, np.float32, scratch_dir) as hdr, \
+                SharedArray.create(images[0].shape, np.uint8, scratch_dir) as ldr:
+            # handles carry no pixel data
+            assert len(pickle.dumps(frames)) < 300
+            ctx = multiprocessing.get_context("fork")
+            with ctx.Pool(1) as pool:
+                pool.apply(merge_shared, (frames, times, hdr, ldr), dict(align=True, deghost=True))
+            assert np.allclose(hdr.array(), expected_hdr)
+            assert np.array_equal(ldr.array(), expected_ldr)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["f0.png", "f1.png", "f2.png"]
@@ -0,0 +1,88 @@
+import os
+import sys
+import json
+import time
+import multiprocessing
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT.parent))
+
+from HDR_Compositor.work_queue import WorkQueue
+from HDR_Compositor.find_and_merge_aeb import run_worker, group_id
+
+GROUPS = [([f"g{i}_a.jpg", f"g{i}_b.jpg"], [1 / 60, 1 / 30]) for i in range(12)]
+
+
+def _fake_process(out_dir, task, paths, times):
+    time.sleep(0.02)
+    path = os.path.join(out_dir, f"hdr_image_{task}_mantiuk.jpg")
+    with open(path, "a") as fh:
+        fh.write(f"{os.getpid()}\n")
+    return [path]
+
+
+def _worker(state_dir, out_dir, name):
+    run_worker(
+        state_dir,
+        discover=lambda: iter(GROUPS),
+        process=lambda t, p, e: _fake_process(out_dir, t, p, e),
+        lease_seconds=5,
+        poll_interval=0.05,
+        worker_id=name,
+    )
+
+
+def test_workers_share_groups(tmp_path):
+    state, out = tmp_path / "state", tmp_path / "out"
+    out.mkdir()
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=_worker, args=(str(state), str(out), f"w{i}")) for i in range(3)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(30)
+        assert p.exitcode == 0
+
+    expected = {group_id(paths) for paths, _ in GROUPS}
+    assert {f.name.split("_")[2] for f in out.iterdir()} == expected
+    # every group merged exactly once
+    assert all(len(f.read_text().splitlines()) == 1 for f in out.iterdir())
+    workers = {json.loads(f.read_text())["worker"] for f in (state / "done").iterdir()}
+    assert workers <= {"w0", "w1", "w2"}
+
+
+def test_expired_lease_is_requeued(tmp_path):
+    crashed = WorkQueue(str(tmp_path), lease_seconds=60, worker_id="crashed")
+    crashed.add("a", {"paths": ["x.jpg"], "exposure_times": [1.0]})
+    assert crashed.claim() == "a"
+
+    other = WorkQueue(str(tmp_path), lease_seconds=60, worker_id="other")
+    assert other.claim() is None
+    lease = tmp_path / "leases" / "a.lease"
+    old = time.time() - 120
+    os.utime(lease, (old, old))
+    assert other.claim() == "a"
+    assert other.owner("a") == "other"
+    assert not crashed.renew("a")
+    other.complete("a", {"outputs": []})
+    assert other.pending() == []
+    assert not lease.exists()
+
+
+def test_claim_does_not_rescan_per_task(monkeypatch, tmp_path):
+    queue = WorkQueue(str(tmp_path), worker_id="w")
+    n = 100
+    for i in range(n):
+        queue.add(f"t{i:03d}", {})
+    calls = []
+    for name in ("listdir", "stat"):
+        real = getattr(os, name)
+        monkeypatch.setattr(os, name, lambda *a, _real=real, **k: calls.append(a) or _real(*a, **k))
+    while True:
+        task = queue.claim()
+        if task is None:
+            break
+        queue.complete(task, {})
+    assert queue.pending() == []
+    assert len(calls) < 4 * n
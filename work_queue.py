@@ -0,0 +1,200 @@
+import os
+import json
+import socket
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Iterable, Iterator, List, Optional, Set
+
+
+class WorkQueue:
+    """Task queue stored in a directory on a shared filesystem.
+
+    Any number of processes, on one host or many, can work through the same
+    queue. The layout below *root* is::
+
+        tasks/<id>.json   task payloads, written once
+        leases/<id>.lease  exclusive claim, created with O_EXCL
+        done/<id>.json    completion record
+
+    A lease is live while its mtime is younger than *lease_seconds*; the
+    holder keeps it fresh with :meth:`renew` (see :meth:`heartbeat`). Leases
+    of crashed workers expire and are taken over by the next :meth:`claim`,
+    so their tasks are re-queued automatically. Hosts sharing a queue need
+    roughly synchronised clocks.
+
+    Completion is permanent, so each instance caches the ids it has seen
+    in ``done/`` and walks a cached task listing, rescanning the directories
+    only when that listing is used up."""
+
+    def __init__(
+        self, root: str, lease_seconds: float = 300.0, worker_id: Optional[str] = None
+    ):
+        self.root = root
+        self.lease_seconds = lease_seconds
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self._done: Set[str] = set()
+        self._backlog: Deque[str] = deque()
+        for sub in ("tasks", "leases", "done"):
+            os.makedirs(os.path.join(root, sub), exist_ok=True)
+
+    def _path(self, sub: str, task_id: str, ext: str) -> str:
+        return os.path.join(self.root, sub, f"{task_id}{ext}")
+
+    def _write_json(self, path: str, data: dict) -> None:
+        """Write *data* to *path* atomically."""
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "w") as fh:
+                json.dump(data, fh)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def add(self, task_id: str, payload: dict) -> bool:
+        """Register a task. Returns False if it already exists."""
+        path = self._path("tasks", task_id, ".json")
+        if os.path.exists(path):
+            return False
+        self._write_json(path, payload)
+        return True
+
+    def load(self, task_id: str) -> dict:
+        with open(self._path("tasks", task_id, ".json")) as fh:
+            return json.load(fh)
+
+    def _list(self, sub: str) -> List[str]:
+        names = os.listdir(os.path.join(self.root, sub))
+        return sorted(n[:-5] for n in names if n.endswith(".json") and not n.startswith("."))
+
+    def task_ids(self) -> List[str]:
+        return self._list("tasks")
+
+    def is_done(self, task_id: str) -> bool:
+        if task_id in self._done:
+            return True
+        if os.path.exists(self._path("done", task_id, ".json")):
+            self._done.add(task_id)
+            return True
+        return False
+
+    def pending(self) -> List[str]:
+        """Return the ids of tasks that have not been completed."""
+        self._done.update(self._list("done"))
+        return [t for t in self.task_ids() if t not in self._done]
+
+    def owner(self, task_id: str) -> Optional[str]:
+        """Return the worker holding the lease on *task_id*, if any."""
+        try:
+            with open(self._path("leases", task_id, ".lease")) as fh:
+                return fh.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _expired(self, path: str) -> bool:
+        try:
+            return time.time() - os.stat(path).st_mtime > self.lease_seconds
+        except FileNotFoundError:
+            return True
+
+    def try_lease(self, task_id: str) -> bool:
+        """Try to take the lease on *task_id*, breaking it if expired."""
+        path = self._path("leases", task_id, ".lease")
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if not self._expired(path):
+                    return False
+                # Rename is atomic, so only one worker can break a stale lease.
+                stale = f"{path}.stale-{self.worker_id}"
+                try:
+                    os.rename(path, stale)
+                except FileNotFoundError:
+                    continue
+                if not self._expired(stale):
+                    # The holder renewed it in the meantime; put it back.
+                    try:
+                        os.link(stale, path)
+                    except FileExistsError:
+                        pass
+                    os.remove(stale)
+                    return False
+                os.remove(stale)
+                continue
+            with os.fdopen(fd, "w") as fh:
+                fh.write(self.worker_id)
+            return True
+        return False
+
+    def renew(self, task_id: str) -> bool:
+        """Refresh our lease on *task_id*. Returns False if it was lost."""
+        if self.owner(task_id) != self.worker_id:
+            return False
+        try:
+            os.utime(self._path("leases", task_id, ".lease"))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def release(self, task_id: str) -> None:
+        """Drop our lease on *task_id* so another worker can take it."""
+        if self.owner(task_id) == self.worker_id:
+            try:
+                os.remove(self._path("leases", task_id, ".lease"))
+            except FileNotFoundError:
+                pass
+
+    def complete(self, task_id: str, result: dict) -> None:
+        """Record *task_id* as done and release its lease."""
+        self._write_json(
+            self._path("done", task_id, ".json"),
+            {"worker": self.worker_id, "finished": time.time(), **result},
+        )
+        self._done.add(task_id)
+        self.release(task_id)
+
+    def claim(self, skip: Iterable[str] = ()) -> Optional[str]:
+        """Lease the next pending task, or return None if none is free.
+
+        Tasks are taken from the cached listing; the directories are only
+        rescanned once it is used up, so draining N tasks costs O(N)
+        filesystem calls per worker instead of O(N) per claim."""
+        skip = set(skip)
+        rescanned = False
+        while True:
+            if not self._backlog:
+                if rescanned:
+                    return None
+                self._backlog.extend(self.pending())
+                rescanned = True
+                continue
+            task_id = self._backlog.popleft()
+            if task_id in skip or task_id in self._done or not self.try_lease(task_id):
+                continue
+            if self.is_done(task_id):  # finished after we listed it
+                self.release(task_id)
+                continue
+            return task_id
+
+    @contextmanager
+    def heartbeat(self, task_id: str) -> Iterator[None]:
+        """Keep the lease on *task_id* fresh while the block runs."""
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.lease_seconds / 3):
+                if not self.renew(task_id):
+                    return
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()